@@ -2,9 +2,19 @@
 """Script to enhance Grafana dashboard with additional panels."""
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DASHBOARD_PATH = 'grafana/dashboards/health-dashboard.json'
+
 # Load existing dashboard
-with open('grafana/dashboards/health-dashboard.json', 'r') as f:
-    dashboard = json.load(f)
+with open(DASHBOARD_PATH, 'rb') as f:
+    if orjson:
+        dashboard = orjson.loads(f.read())
+    else:
+        dashboard = json.loads(f.read())
 
 # Sodium panel (ID: 5, positioned at y=16)
 sodium_panel = {
@@ -155,9 +165,12 @@ correlation_panel = {
 dashboard['panels'].append(sodium_panel)
 dashboard['panels'].append(correlation_panel)
 
-# Save enhanced dashboard
-with open('grafana/dashboards/health-dashboard.json', 'w') as f:
-    json.dump(dashboard, f, indent=2)
+# Save enhanced dashboard in one write() instead of per-token dumps
+with open(DASHBOARD_PATH, 'wb') as f:
+    if orjson:
+        f.write(orjson.dumps(dashboard, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+    else:
+        f.write(json.dumps(dashboard, indent=2).encode('utf-8'))
 
 print("✓ Dashboard enhanced with:")
 print("  • Sodium intake panel with threshold alerts (2300mg limit)")
@@ -5,13 +5,16 @@ import sys
 import json
 from datetime import datetime, timedelta
 from typing import List, Dict
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from database import HealthDatabase
+from database import get_db
 
 load_dotenv()
 
@@ -20,15 +23,32 @@ class HealthChatbot:
     """Chat interface for analyzing health data with Ollama."""
     
     def __init__(self):
-        self.db = HealthDatabase()
+        self.db = get_db()
         self.ollama_host = os.getenv('OLLAMA_HOST', 'http://192.168.1.26:11434')
         self.ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:7b-instruct')
+        self._summary_key = None
+        self._summary = None
+        # Reuse one HTTP connection to Ollama across chat turns, retrying
+        # transient errors (e.g. model warmup) on the same connection
+        self.session = requests.Session()
+        self.session.headers.update({"Connection": "keep-alive"})
+        adapter = HTTPAdapter(max_retries=Retry(
+            total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504)
+        ))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._ctx_id = None
+        self._prompt_base = None
         
     def query_recent_data(self, days: int = 30) -> List[Dict]:
         """Query recent nutrition data."""
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
-        return self.db.query_date_range(start_date, end_date)
+        # Only fetch the fields format_data_summary actually uses
+        return self.db.query_date_range(
+            start_date, end_date,
+            columns=['calories', 'protein_g', 'carbs_g', 'fat_g', 'weight_lbs']
+        )
     
     def query_top_foods(self, days: int = 30, limit: int = 20) -> List[Dict]:
         """Query most frequently eaten foods."""
@@ -63,18 +83,34 @@ class HealthChatbot:
         """Create a human-readable summary of nutrition data."""
         if not data:
             return "No data available for this period."
-        
-        # Calculate statistics
+
+        # The same data list is summarized on every chat turn; reuse the
+        # formatted string until the loaded data changes
+        cache_key = (id(data), id(top_foods))
+        if cache_key == self._summary_key:
+            return self._summary
+
+        # Calculate statistics in single C-level passes
         total_days = len(data)
-        avg_calories = sum(d.get('calories', 0) for d in data) / total_days
-        avg_protein = sum(d.get('protein_g', 0) for d in data) / total_days
-        avg_carbs = sum(d.get('carbs_g', 0) for d in data) / total_days
-        avg_fat = sum(d.get('fat_g', 0) for d in data) / total_days
-        
+        avg_calories = np.fromiter(
+            (d.get('calories', 0) for d in data), dtype=np.float64, count=total_days
+        ).mean()
+        avg_protein = np.fromiter(
+            (d.get('protein_g', 0) for d in data), dtype=np.float64, count=total_days
+        ).mean()
+        avg_carbs = np.fromiter(
+            (d.get('carbs_g', 0) for d in data), dtype=np.float64, count=total_days
+        ).mean()
+        avg_fat = np.fromiter(
+            (d.get('fat_g', 0) for d in data), dtype=np.float64, count=total_days
+        ).mean()
+
         # Weight data
-        weights = [d.get('weight_lbs') for d in data if d.get('weight_lbs')]
+        weights = np.fromiter(
+            (d['weight_lbs'] for d in data if d.get('weight_lbs')), dtype=np.float64
+        )
         weight_summary = ""
-        if weights:
+        if weights.size:
             weight_change = weights[-1] - weights[0]
             weight_summary = f"\nWeight: {weights[0]:.1f} → {weights[-1]:.1f} lbs ({weight_change:+.1f} lbs)"
         
@@ -95,14 +131,23 @@ Average Daily Intake:
                 count = food.get('count', 0)
                 avg_cal = food.get('avg_calories', 0)
                 summary += f"\n  {i}. {name} ({count}x, ~{avg_cal:.0f} cal avg)"
-        
+
+        self._summary_key = cache_key
+        self._summary = summary
         return summary
     
     def chat_with_ollama(self, user_message: str, context_data: List[Dict], top_foods: List[Dict] = None, recent_foods: List[Dict] = None) -> str:
         """Send message to Ollama with health data context."""
-        # Prepare data context
-        data_summary = self.format_data_summary(context_data, top_foods)
-        
+        # Rebuild the data-context block only when the loaded data changes;
+        # an unchanged prefix also lets Ollama reuse its prompt cache
+        if id(context_data) != self._ctx_id:
+            data_summary = self.format_data_summary(context_data, top_foods)
+            self._prompt_base = f"""You are a health and nutrition analyst. You help users understand their nutrition and weight data from the Lose It! app.
+
+Current data context:
+{data_summary}"""
+            self._ctx_id = id(context_data)
+
         # Add recent foods context if asking about specific meals
         recent_foods_text = ""
         if recent_foods and any(word in user_message.lower() for word in ['yesterday', 'today', 'ate', 'food', 'meal', 'eat']):
@@ -113,18 +158,15 @@ Average Daily Intake:
                 qty = food.get('quantity', '')
                 cal = food.get('calories', 0)
                 recent_foods_text += f"\n  - {time}: {name} ({qty}) - {cal:.0f} cal"
-        
-        # Build system prompt
-        system_prompt = f"""You are a health and nutrition analyst. You help users understand their nutrition and weight data from the Lose It! app.
 
-Current data context:
-{data_summary}{recent_foods_text}
+        # Build system prompt
+        system_prompt = f"""{self._prompt_base}{recent_foods_text}
 
 Provide helpful insights, identify trends, and answer questions about the data. Be concise but informative. When asked about specific foods eaten, refer to the Recent Foods list above."""
-        
+
         # Call Ollama API
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ollama_host}/api/chat",
                 json={
                     "model": self.ollama_model,
@@ -132,7 +174,9 @@ Provide helpful insights, identify trends, and answer questions about the data.
                         {"role": "system", "content": system_prompt},
                         {"role": "user", "content": user_message}
                     ],
-                    "stream": False
+                    "stream": False,
+                    # Keep the model loaded between turns
+                    "keep_alive": "30m"
                 },
                 timeout=60
             )
@@ -1,186 +1,352 @@
 """Parser for Lose It! CSV data files."""
 import io
 import csv
+import heapq
 from datetime import datetime
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional
 from dateutil import parser as date_parser
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
 
 class LoseItCSVParser:
     """Parses Lose It! CSV exports and aggregates nutrition data by day."""
-    
+
+    # Canonical output key -> column name variants seen in Lose It! exports
+    NUTRITION_COLUMNS = {
+        'calories': ('Calories',),
+        'protein_g': ('Protein (g)', 'Protein(g)'),
+        'carbs_g': ('Carbohydrates (g)', 'Carbohydrates(g)'),
+        'fat_g': ('Fat (g)', 'Fat(g)'),
+        'sodium_mg': ('Sodium (mg)', 'Sodium(mg)'),
+        'sugar_g': ('Sugars (g)', 'Sugars(g)'),
+        'fiber_g': ('Fiber (g)', 'Fiber(g)'),
+    }
+
+    # Template copied for each new date; cheaper than a 9-key dict literal
+    _EMPTY_DAY = {
+        'date': None,
+        'calories': 0.0,
+        'protein_g': 0.0,
+        'carbs_g': 0.0,
+        'fat_g': 0.0,
+        'sodium_mg': 0.0,
+        'sugar_g': 0.0,
+        'fiber_g': 0.0,
+        'weight_lbs': None,
+    }
+
     def parse_csv(self, csv_data: bytes, extract_foods: bool = False) -> tuple:
         """
         Parse CSV data from Lose It! export.
-        
+
         Args:
             csv_data: Raw CSV file content as bytes
             extract_foods: If True, also return individual food entries
-            
+
         Returns:
             If extract_foods=False: (daily_data, [])
             If extract_foods=True: (daily_data, food_entries)
         """
-        # Decode CSV data
-        csv_text = csv_data.decode('utf-8')
-        csv_file = io.StringIO(csv_text)
-        
-        reader = csv.DictReader(csv_file)
-        
-        # Aggregate by day and optionally collect food entries
-        days = {}
+        # Vectorized pyarrow path: parsing and daily aggregation run in
+        # Arrow's native kernels instead of a per-row Python loop.
+        if pa is not None:
+            try:
+                return self._parse_csv_arrow(csv_data, extract_foods)
+            except Exception as e:
+                print(f"Warning: Fast CSV path failed ({e}), using row-by-row parser")
+
+        return self._parse_csv_rows(csv_data, extract_foods)
+
+    @staticmethod
+    def _as_binary_stream(csv_data):
+        """Wrap raw bytes in a stream; pass open file handles through."""
+        if isinstance(csv_data, (bytes, bytearray, memoryview)):
+            return io.BytesIO(csv_data)
+        return csv_data
+
+    def _parse_csv_arrow(self, csv_data: bytes, extract_foods: bool = False) -> tuple:
+        """Parse and aggregate with pyarrow's vectorized CSV reader."""
+        table = pa_csv.read_csv(
+            self._as_binary_stream(csv_data),
+            convert_options=pa_csv.ConvertOptions(
+                null_values=[''],
+                strings_can_be_null=True,
+            ),
+        )
+        names = set(table.column_names)
+
+        if 'Date' not in names:
+            return [], []
+
+        # Normalize dates to ISO strings in one vectorized pass
+        date_col = table['Date']
+        if pa.types.is_temporal(date_col.type):
+            date_keys = pc.strftime(date_col, format='%Y-%m-%d')
+        else:
+            parsed = pc.strptime(pc.cast(date_col, pa.string()), format='%m/%d/%Y', unit='s')
+            date_keys = pc.strftime(parsed, format='%Y-%m-%d')
+
+        # Normalize alternate column names and coerce to float64
+        columns = {'date': date_keys}
+        for out_key, candidates in self.NUTRITION_COLUMNS.items():
+            actual = next((c for c in candidates if c in names), None)
+            if actual is not None:
+                columns[out_key] = pc.fill_null(self._to_float64(table[actual]), 0.0)
+            else:
+                columns[out_key] = pa.nulls(len(table), pa.float64())
+
+        if 'Weight' in names:
+            columns['weight_lbs'] = self._to_float64(table['Weight'])
+        else:
+            columns['weight_lbs'] = pa.nulls(len(table), pa.float64())
+
+        # Food columns ride along inside the normalized table so the date
+        # filter below keeps them aligned with the nutrition values; cast
+        # to string since pyarrow may infer these columns as numeric
+        if extract_foods and 'Name' in names:
+            columns['food_name'] = pc.cast(table['Name'], pa.string())
+            if 'Quantity' in names:
+                columns['quantity'] = pc.cast(table['Quantity'], pa.string())
+            else:
+                columns['quantity'] = pa.nulls(len(table), pa.string())
+
+        normalized = pa.table(columns)
+        normalized = normalized.filter(pc.is_valid(normalized['date']))
+
+        # Aggregate daily totals in Arrow; weight uses max, not sum
+        grouped = normalized.group_by('date').aggregate(
+            [(k, 'sum') for k in self.NUTRITION_COLUMNS] + [('weight_lbs', 'max')]
+        )
+        grouped = grouped.sort_by('date')
+
+        result = []
+        for row in grouped.to_pylist():
+            day = {'date': row['date']}
+            for k in self.NUTRITION_COLUMNS:
+                day[k] = row[f'{k}_sum'] or 0
+            day['weight_lbs'] = row['weight_lbs_max']
+            result.append(day)
+
         food_entries = []
-        
+        if extract_foods and 'food_name' in normalized.column_names:
+            for row in normalized.to_pylist():
+                food_name = (row['food_name'] or '').strip()
+                if not food_name:
+                    continue
+                food_entries.append({
+                    'date': row['date'],
+                    'food_name': food_name,
+                    'quantity': (row['quantity'] or '').strip(),
+                    'calories': row['calories'] or 0,
+                    'protein_g': row['protein_g'] or 0,
+                    'carbs_g': row['carbs_g'] or 0,
+                    'fat_g': row['fat_g'] or 0,
+                    'sodium_mg': row['sodium_mg'] or 0,
+                    'sugar_g': row['sugar_g'] or 0,
+                    'fiber_g': row['fiber_g'] or 0,
+                })
+
+        if extract_foods:
+            print(f"✓ Parsed {len(result)} days of nutrition data and {len(food_entries)} food entries")
+        else:
+            print(f"✓ Parsed {len(result)} days of nutrition data")
+
+        return result, food_entries
+
+    @staticmethod
+    def _to_float64(col):
+        """Cast an Arrow column to float64, stripping thousands separators."""
+        if pa.types.is_floating(col.type) or pa.types.is_integer(col.type):
+            return pc.cast(col, pa.float64())
+        cleaned = pc.replace_substring(pc.cast(col, pa.string()), ',', '')
+        return pc.cast(cleaned, pa.float64())
+
+    def _parse_csv_rows(self, csv_data: bytes, extract_foods: bool = False) -> tuple:
+        """Row-by-row fallback parser (used when pyarrow is unavailable)."""
+        days = {}
+        food_entries = [] if extract_foods else None
+
+        self._aggregate_rows_into(csv_data, days, food_entries)
+
+        # Convert to list and sort by date
+        result = sorted(days.values(), key=lambda x: x['date'])
+
+        if extract_foods:
+            print(f"✓ Parsed {len(result)} days of nutrition data and {len(food_entries)} food entries")
+            return result, food_entries
+        else:
+            print(f"✓ Parsed {len(result)} days of nutrition data")
+            return result, []
+
+    def _aggregate_rows_into(self, csv_data: bytes, days: Dict,
+                             food_entries: Optional[List] = None):
+        """
+        Aggregate one CSV's rows into a shared per-day dict.
+
+        Args:
+            csv_data: Raw CSV file content as bytes
+            days: date-key -> daily totals dict, shared across files
+            food_entries: If not None, individual food entries are appended
+        """
+        # Decode lazily as the CSV reader consumes lines, instead of
+        # materializing the whole file as one str up front
+        csv_file = io.TextIOWrapper(
+            self._as_binary_stream(csv_data), encoding='utf-8', newline=''
+        )
+
+        reader = csv.DictReader(csv_file)
+
+        # Resolve each canonical key to the column variant this file uses
+        # once, so the per-row path is a single dict lookup per field
+        fieldnames = reader.fieldnames or []
+        col = {}
+        for out_key, candidates in self.NUTRITION_COLUMNS.items():
+            actual = next((c for c in candidates if c in fieldnames), None)
+            if actual is None and fieldnames:
+                print(f"Warning: No '{out_key}' column found (tried {', '.join(candidates)})")
+            col[out_key] = actual
+
+        _pn = self._parse_number
+
+        # Lose It! exports repeat the same date across many food rows, so
+        # cache parsed dates instead of re-parsing each occurrence.
+        date_cache = {}
+
         for row in reader:
             if not row.get('Date'):
                 continue
-            
+
             date_str = row['Date']
-            
-            # Parse date
-            try:
-                date_obj = date_parser.parse(date_str).date()
-                date_key = date_obj.isoformat()
-            except Exception as e:
-                print(f"Warning: Could not parse date '{date_str}': {e}")
-                continue
+
+            # Parse date (cached per unique string)
+            date_key = date_cache.get(date_str)
+            if date_key is None:
+                try:
+                    date_key = datetime.strptime(date_str, '%m/%d/%Y').date().isoformat()
+                except ValueError:
+                    # Unexpected format: fall back to dateutil's full parser
+                    try:
+                        date_key = date_parser.parse(date_str).date().isoformat()
+                    except Exception as e:
+                        print(f"Warning: Could not parse date '{date_str}': {e}")
+                        continue
+                date_cache[date_str] = date_key
             
             # Initialize day entry if needed
-            if date_key not in days:
-                days[date_key] = {
-                    'date': date_key,
-                    'calories': 0,
-                    'protein_g': 0,
-                    'carbs_g': 0,
-                    'fat_g': 0,
-                    'sodium_mg': 0,
-                    'sugar_g': 0,
-                    'fiber_g': 0,
-                    'weight_lbs': None,
-                }
-            
+            entry = days.get(date_key)
+            if entry is None:
+                entry = self._EMPTY_DAY.copy()
+                entry['date'] = date_key
+                days[date_key] = entry
+
             # Add food/nutrition data
             if row.get('Calories'):
                 try:
-                    calories = self._parse_number(row.get('Calories', 0))
-                    protein_g = self._parse_number(
-                        row.get('Protein (g)') or row.get('Protein(g)', 0)
-                    )
-                    carbs_g = self._parse_number(
-                        row.get('Carbohydrates (g)') or row.get('Carbohydrates(g)', 0)
-                    )
-                    fat_g = self._parse_number(
-                        row.get('Fat (g)') or row.get('Fat(g)', 0)
-                    )
-                    sodium_mg = self._parse_number(
-                        row.get('Sodium (mg)') or row.get('Sodium(mg)', 0)
-                    )
-                    sugar_g = self._parse_number(
-                        row.get('Sugars (g)') or row.get('Sugars(g)', 0)
-                    )
-                    fiber_g = self._parse_number(
-                        row.get('Fiber (g)') or row.get('Fiber(g)', 0)
-                    )
-                    
+                    values = {
+                        out_key: _pn(row.get(src)) if src else 0.0
+                        for out_key, src in col.items()
+                    }
+
                     # Aggregate to daily totals
-                    days[date_key]['calories'] += calories
-                    days[date_key]['protein_g'] += protein_g
-                    days[date_key]['carbs_g'] += carbs_g
-                    days[date_key]['fat_g'] += fat_g
-                    days[date_key]['sodium_mg'] += sodium_mg
-                    days[date_key]['sugar_g'] += sugar_g
-                    days[date_key]['fiber_g'] += fiber_g
-                    
+                    for out_key, value in values.items():
+                        entry[out_key] += value
+
                     # Capture individual food entry if requested
-                    if extract_foods:
+                    if food_entries is not None:
                         food_name = row.get('Name', '').strip()
                         quantity = row.get('Quantity', '').strip()
-                        
+
                         if food_name:  # Only add if food has a name
                             food_entry = {
                                 'date': date_key,
                                 'food_name': food_name,
                                 'quantity': quantity,
-                                'calories': calories,
-                                'protein_g': protein_g,
-                                'carbs_g': carbs_g,
-                                'fat_g': fat_g,
-                                'sodium_mg': sodium_mg,
-                                'sugar_g': sugar_g,
-                                'fiber_g': fiber_g,
+                                **values,
                             }
                             food_entries.append(food_entry)
-                    
+
                 except Exception as e:
                     print(f"Warning: Error parsing nutrition data for {date_key}: {e}")
             
             # Add weight data (overwrites if multiple entries)
             if row.get('Weight'):
                 try:
-                    days[date_key]['weight_lbs'] = self._parse_number(row['Weight'])
+                    entry['weight_lbs'] = _pn(row['Weight'])
                 except Exception as e:
                     print(f"Warning: Error parsing weight for {date_key}: {e}")
-        
-        # Convert to list and sort by date
-        result = sorted(days.values(), key=lambda x: x['date'])
-        
-        if extract_foods:
-            print(f"✓ Parsed {len(result)} days of nutrition data and {len(food_entries)} food entries")
-            return result, food_entries
-        else:
-            print(f"✓ Parsed {len(result)} days of nutrition data")
-            return result, []
-    
+
+    # Translation table stripping thousands separators
+    _THOUSANDS = str.maketrans('', '', ',')
+
     def _parse_number(self, value) -> float:
         """Safely parse a numeric value."""
-        if value is None or value == '':
+        if not value:
             return 0.0
-        
+        if type(value) is float:
+            return value
+
+        # Fast path: most cells are plain numbers with no commas
         try:
-            # Remove commas and parse
-            if isinstance(value, str):
-                value = value.replace(',', '')
             return float(value)
         except (ValueError, TypeError):
+            pass
+
+        try:
+            return float(value.translate(self._THOUSANDS))
+        except Exception:
             return 0.0
     
-    def parse_multiple_csvs(self, csv_files: List[bytes], extract_foods: bool = False) -> tuple:
+    def parse_multiple_csvs(self, csv_files: Iterable[bytes], extract_foods: bool = False) -> tuple:
         """
         Parse multiple CSV files and combine data.
-        
+
         Args:
-            csv_files: List of CSV file contents as bytes
+            csv_files: Iterable of CSV file contents as bytes; consumed
+                lazily, so a generator lets parsing overlap with fetching
             extract_foods: If True, also return individual food entries
-            
+
         Returns:
             (daily_nutrition_data, food_entries)
         """
-        all_data = {}
         all_foods = []
-        
-        for csv_data in csv_files:
-            parsed, foods = self.parse_csv(csv_data, extract_foods=extract_foods)
-            all_foods.extend(foods)
-            
-            # Merge daily data by date (later data overwrites earlier)
-            for entry in parsed:
-                date_key = entry['date']
-                if date_key in all_data:
+
+        if pa is None:
+            # No vectorized path: stream every file's rows straight into one
+            # shared per-day dict and sort once at the end, instead of
+            # building and re-merging a sorted list per file
+            all_data = {}
+            for csv_data in csv_files:
+                self._aggregate_rows_into(
+                    csv_data, all_data, all_foods if extract_foods else None
+                )
+            result = sorted(all_data.values(), key=lambda x: x['date'])
+        else:
+            parsed_lists = []
+            for csv_data in csv_files:
+                parsed, foods = self.parse_csv(csv_data, extract_foods=extract_foods)
+                all_foods.extend(foods)
+                parsed_lists.append(parsed)
+
+            # Each per-file list is already date-sorted, so a heap merge
+            # combines them in one linear pass with no re-sort; adjacent
+            # entries for the same date collapse as they stream by
+            result = []
+            for entry in heapq.merge(*parsed_lists, key=lambda x: x['date']):
+                if result and result[-1]['date'] == entry['date']:
                     # Merge: sum nutrition values, keep latest weight
-                    all_data[date_key]['calories'] += entry['calories']
-                    all_data[date_key]['protein_g'] += entry['protein_g']
-                    all_data[date_key]['carbs_g'] += entry['carbs_g']
-                    all_data[date_key]['fat_g'] += entry['fat_g']
-                    all_data[date_key]['sodium_mg'] += entry['sodium_mg']
-                    all_data[date_key]['sugar_g'] += entry['sugar_g']
-                    all_data[date_key]['fiber_g'] += entry['fiber_g']
+                    existing = result[-1]
+                    for k in self.NUTRITION_COLUMNS:
+                        existing[k] += entry[k]
                     if entry['weight_lbs']:
-                        all_data[date_key]['weight_lbs'] = entry['weight_lbs']
+                        existing['weight_lbs'] = entry['weight_lbs']
                 else:
-                    all_data[date_key] = entry
-        
-        # Convert to sorted list
-        result = sorted(all_data.values(), key=lambda x: x['date'])
+                    result.append(entry)
         
         if extract_foods:
             print(f"✓ Combined into {len(result)} unique days and {len(all_foods)} food entries")
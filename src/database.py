@@ -1,12 +1,48 @@
 """InfluxDB database utilities for health data storage."""
+import atexit
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import chain, islice
 from typing import Dict, List, Optional
 from influxdb import InfluxDBClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Points per write request; keeps each HTTP POST in InfluxDB's sweet spot
+INFLUX_BATCH_SIZE = 5000
+
+# The numeric fields shared by every nutrition measurement
+NUTRITION_FIELD_KEYS = ('calories', 'protein_g', 'carbs_g', 'fat_g',
+                        'sodium_mg', 'sugar_g', 'fiber_g')
+
+
+def _nutrition_fields(src: Dict) -> Dict:
+    """Extract the nutrition fields from a source dict, coerced to float."""
+    return {k: float(src.get(k, 0)) for k in NUTRITION_FIELD_KEYS}
+
+
+@lru_cache(maxsize=4096)
+def _epoch_seconds(date_str: str) -> int:
+    """Epoch seconds for an ISO date string (memoized per unique string)."""
+    return _to_epoch(datetime.fromisoformat(date_str))
+
+
+def _to_epoch(date) -> int:
+    """Epoch seconds for an ISO string or datetime.
+
+    Naive values are pinned to UTC, matching how InfluxDB interprets
+    timestamps without an offset; .timestamp() alone would shift them
+    into the host's local timezone.
+    """
+    if isinstance(date, str):
+        return _epoch_seconds(date)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
 
 class HealthDatabase:
     """Manages InfluxDB connection and data operations."""
@@ -17,29 +53,134 @@ class HealthDatabase:
         self.username = os.getenv('INFLUXDB_USERNAME', 'health_user')
         self.password = os.getenv('INFLUXDB_PASSWORD', 'health_password')
         self.database = os.getenv('INFLUXDB_DATABASE', 'HealthStats')
+        self.db_marker_file = os.getenv('INFLUXDB_ENSURE_MARKER', '.influx_db_created')
         
         self.client = None
-        
+        # Cached query results: (start_str, end_str) -> (fetched_at, points)
+        self._query_cache = {}
+
     def connect(self):
-        """Establish connection to InfluxDB."""
+        """Establish connection to InfluxDB (no-op if already connected)."""
+        if self.client is not None:
+            try:
+                self.client.ping()
+                return True
+            except Exception:
+                pass  # stale connection; rebuild below
+
         try:
             self.client = InfluxDBClient(
                 host=self.host,
                 port=self.port,
                 username=self.username,
                 password=self.password,
-                database=self.database
+                database=self.database,
+                timeout=30,
+                retries=3,
+                # Compress write payloads and pool connections so chunked
+                # batch writes reuse one TCP session
+                gzip=True,
+                pool_size=10
             )
-            # Create database if it doesn't exist
-            databases = self.client.get_list_database()
-            if {'name': self.database} not in databases:
-                self.client.create_database(self.database)
+            # Keep pooled connections alive across the chunked batch writes
+            session = getattr(self.client, '_session', None)
+            if session is not None:
+                session.headers.setdefault('Connection', 'keep-alive')
+            # Create database if it doesn't exist; once it has been ensured
+            # successfully, a marker file lets later runs skip these
+            # round-trips entirely
+            if not self._database_already_ensured():
+                databases = self.client.get_list_database()
+                created = {'name': self.database} not in databases
+                if created:
+                    self.client.create_database(self.database)
+                self._ensure_retention_policy(created)
+                self._ensure_continuous_queries()
+                self._mark_database_ensured()
             print(f"✓ Connected to InfluxDB at {self.host}:{self.port}")
             return True
         except Exception as e:
             print(f"✗ Failed to connect to InfluxDB: {e}")
             return False
     
+    def _database_already_ensured(self) -> bool:
+        """Check the marker left by a previous successful schema setup."""
+        try:
+            with open(self.db_marker_file) as f:
+                return f.read().strip() == self.database
+        except OSError:
+            return False
+
+    def _mark_database_ensured(self):
+        """Record that database, retention policy and CQs are in place."""
+        try:
+            with open(self.db_marker_file, 'w') as f:
+                f.write(self.database)
+        except OSError:
+            pass
+
+    def _ensure_retention_policy(self, created: bool):
+        """Configure 7-day shard groups for the default retention policy.
+
+        With the default shard duration, a 30-day look-back can open shard
+        groups spanning far more data than the predicate needs; 7-day
+        shards bound such queries to a handful of shard files.
+
+        Args:
+            created: Whether create_database just ran for this database
+        """
+        try:
+            if created:
+                self.client.query(
+                    f'CREATE RETENTION POLICY "rp_default" ON "{self.database}" '
+                    'DURATION INF REPLICATION 1 SHARD DURATION 7d DEFAULT'
+                )
+            else:
+                # Existing data lives under autogen; switching the default
+                # policy would hide it from every unqualified query, so
+                # re-shard autogen in place instead
+                self.client.query(
+                    f'ALTER RETENTION POLICY "autogen" ON "{self.database}" '
+                    'SHARD DURATION 7d'
+                )
+        except Exception as e:
+            print(f"Warning: Could not configure retention policy: {e}")
+
+    def _ensure_continuous_queries(self):
+        """Create the daily food rollup used by query_top_foods.
+
+        The rollup keeps per-day COUNT/SUM per food_name in
+        food_daily_agg, so the top-foods query scans days x foods instead
+        of every raw food_entries point in the window.
+        """
+        rollup = (
+            'SELECT COUNT(calories) AS count, '
+            'SUM(calories) AS sum_calories, '
+            'SUM(sodium_mg) AS sum_sodium '
+            'INTO food_daily_agg FROM food_entries '
+            'GROUP BY time(1d), food_name'
+        )
+        # RESAMPLE re-runs the open 1d bucket hourly, so the current day
+        # shows up in the rollup before its interval closes
+        cq = (
+            f'CREATE CONTINUOUS QUERY food_daily ON "{self.database}" '
+            f'RESAMPLE EVERY 1h FOR 2d BEGIN {rollup} END'
+        )
+        try:
+            self.client.query(cq)
+        except Exception as e:
+            # Re-creating an existing CQ raises; that's the normal case
+            if 'already exists' not in str(e):
+                print(f"Warning: Could not create continuous query: {e}")
+            return
+
+        # CQs never process data written before they existed, so on first
+        # creation run the same aggregation once over all of history
+        try:
+            self.client.query(rollup)
+        except Exception as e:
+            print(f"Warning: Could not backfill food rollup: {e}")
+
     def write_daily_nutrition(self, date: datetime, data: Dict):
         """
         Write daily nutrition data to InfluxDB.
@@ -51,26 +192,20 @@ class HealthDatabase:
         if not self.client:
             raise RuntimeError("Database not connected. Call connect() first.")
         
-        point = {
-            "measurement": "daily_nutrition",
-            "time": date.isoformat(),
-            "fields": {
-                "calories": float(data.get('calories', 0)),
-                "protein_g": float(data.get('protein_g', 0)),
-                "carbs_g": float(data.get('carbs_g', 0)),
-                "fat_g": float(data.get('fat_g', 0)),
-                "sodium_mg": float(data.get('sodium_mg', 0)),
-                "sugar_g": float(data.get('sugar_g', 0)),
-                "fiber_g": float(data.get('fiber_g', 0)),
-            }
-        }
-        
+        # Reuse the line-protocol formatter so even single-point writes
+        # skip the client's JSON serialization
+        entry = _nutrition_fields(data)
+        entry['date'] = date
+
         # Add weight if available
         if data.get('weight_lbs'):
-            point['fields']['weight_lbs'] = float(data['weight_lbs'])
-        
+            entry['weight_lbs'] = float(data['weight_lbs'])
+
         try:
-            self.client.write_points([point])
+            self.client.write_points(
+                list(self._nutrition_lines([entry])),
+                protocol='line', time_precision='s'
+            )
             return True
         except Exception as e:
             print(f"Error writing to InfluxDB: {e}")
@@ -79,78 +214,168 @@ class HealthDatabase:
     def batch_write_nutrition(self, entries: List[Dict]):
         """
         Write multiple nutrition entries in batch.
-        
+
         Args:
-            entries: List of dicts with 'date' and nutrition data
+            entries: List of dicts with 'date' and nutrition data; values
+                must already be numeric, as produced by LoseItCSVParser
         """
         if not self.client:
             raise RuntimeError("Database not connected. Call connect() first.")
-        
-        points = []
+
+        written, success = self._write_line_chunks(self._nutrition_lines(entries))
+
+        if written:
+            self._query_cache.clear()
+        if success:
+            print(f"✓ Wrote {written} nutrition entries to database")
+        return success
+
+    def _write_line_chunks(self, lines) -> tuple:
+        """
+        Write an iterable of line-protocol strings in bounded batches.
+
+        Consumes the iterable lazily so only one chunk of formatted lines
+        is alive at a time; a transient failure on one chunk doesn't abort
+        the rest of the sync.
+
+        Returns:
+            (lines_written, all_chunks_succeeded)
+        """
+        written = 0
+        success = True
+        while True:
+            chunk = list(islice(lines, INFLUX_BATCH_SIZE))
+            if not chunk:
+                break
+            try:
+                self.client.write_points(
+                    chunk, protocol='line',
+                    batch_size=INFLUX_BATCH_SIZE, time_precision='s'
+                )
+                written += len(chunk)
+            except Exception as e:
+                print(f"✗ Error batch writing to InfluxDB: {e}")
+                success = False
+        return written, success
+
+    @staticmethod
+    def _escape_tag(value: str) -> str:
+        """Escape a tag value for line protocol."""
+        return (value.replace('\\', '\\\\').replace(',', '\\,')
+                .replace('=', '\\=').replace(' ', '\\ '))
+
+    @staticmethod
+    def _escape_string_field(value: str) -> str:
+        """Escape a string field value for line protocol."""
+        return value.replace('\\', '\\\\').replace('"', '\\"')
+
+    @staticmethod
+    def _nutrition_lines(entries):
+        """Lazily format nutrition entries as line protocol strings."""
         for entry in entries:
             date = entry.get('date')
-            if isinstance(date, str):
-                date = datetime.fromisoformat(date)
-            
-            point = {
-                "measurement": "daily_nutrition",
-                "time": date.isoformat(),
-                "fields": {
-                    "calories": float(entry.get('calories', 0)),
-                    "protein_g": float(entry.get('protein_g', 0)),
-                    "carbs_g": float(entry.get('carbs_g', 0)),
-                    "fat_g": float(entry.get('fat_g', 0)),
-                    "sodium_mg": float(entry.get('sodium_mg', 0)),
-                    "sugar_g": float(entry.get('sugar_g', 0)),
-                    "fiber_g": float(entry.get('fiber_g', 0)),
-                }
-            }
-            
-            if entry.get('weight_lbs'):
-                point['fields']['weight_lbs'] = float(entry['weight_lbs'])
-            
-            points.append(point)
-        
-        try:
-            self.client.write_points(points)
-            print(f"✓ Wrote {len(points)} nutrition entries to database")
-            return True
-        except Exception as e:
-            print(f"✗ Error batch writing to InfluxDB: {e}")
-            return False
+            # Daily data: second precision halves the timestamp bytes vs ns.
+            # ISO strings convert through the memoized helper, skipping a
+            # datetime round-trip per repeated date.
+            ts = _to_epoch(date)
+
+            # Values arrive pre-typed from the parser, so no float() per field
+            fields = ','.join(
+                f"{k}={entry.get(k, 0.0)}" for k in NUTRITION_FIELD_KEYS
+            )
+            if (weight := entry.get('weight_lbs')):
+                fields += f",weight_lbs={weight}"
+
+            yield f"daily_nutrition {fields} {ts}"
     
-    def query_date_range(self, start_date: datetime, end_date: datetime) -> List[Dict]:
+    def query_date_range(self, start_date: datetime, end_date: datetime,
+                         columns: Optional[List[str]] = None) -> List[Dict]:
         """
         Query nutrition data for a date range.
-        
+
         Args:
             start_date: Start date
             end_date: End date
-            
+            columns: Optional list of field names to fetch; defaults to all
+
         Returns:
             List of nutrition data points
         """
-        if not self.client:
-            raise RuntimeError("Database not connected. Call connect() first.")
-        
-        # Format timestamps for InfluxDB (RFC3339 format with Z)
-        start_str = start_date.strftime('%Y-%m-%dT%H:%M:%SZ')
-        end_str = end_date.strftime('%Y-%m-%dT%H:%M:%SZ')
-        
-        query = f"""
-        SELECT * FROM daily_nutrition 
-        WHERE time >= '{start_str}' 
-        AND time <= '{end_str}'
-        ORDER BY time ASC
-        """
-        
+        # Serve repeated range queries from cache for 5 minutes; the cache
+        # is invalidated whenever new data is written
+        cache_key = self._range_key(start_date, end_date, columns)
+        cached = self._query_cache.get(cache_key)
+        if cached and time.time() - cached[0] < 300:
+            return cached[1]
+
         try:
-            result = self.client.query(query)
-            points = list(result.get_points())
+            points = list(self.iter_date_range(start_date, end_date, columns))
+            self._query_cache[cache_key] = (time.time(), points)
             return points
         except Exception as e:
             print(f"Error querying InfluxDB: {e}")
             return []
+
+    def iter_date_range(self, start_date: datetime, end_date: datetime,
+                        columns: Optional[List[str]] = None, chunk_size: int = 10000):
+        """
+        Stream nutrition data for a date range without materializing it.
+
+        Args:
+            start_date: Start date
+            end_date: End date
+            columns: Optional list of field names to fetch; defaults to all
+            chunk_size: Points per response chunk from InfluxDB
+
+        Yields:
+            Nutrition data points, lazily, as chunks arrive
+        """
+        if not self.client:
+            raise RuntimeError("Database not connected. Call connect() first.")
+
+        start_str, end_str, select_clause = self._range_key(
+            start_date, end_date, columns
+        )
+
+        # Timestamps go through server-side bind params rather than string
+        # interpolation (column names cannot be bound)
+        query = f"""
+        SELECT {select_clause} FROM daily_nutrition
+        WHERE time >= $start
+        AND time <= $end
+        ORDER BY time ASC
+        """
+
+        # A chunked query returns a generator of ResultSet objects, one
+        # per response chunk, rather than a single ResultSet
+        result = self.client.query(
+            query,
+            bind_params={'start': start_str, 'end': end_str},
+            chunked=True,
+            chunk_size=chunk_size
+        )
+        for resultset in result:
+            yield from resultset.get_points()
+
+    @staticmethod
+    def _range_key(start_date: datetime, end_date: datetime,
+                   columns: Optional[List[str]]) -> tuple:
+        """Format the (start, end, select-clause) triple for a range query."""
+        # Format timestamps for InfluxDB (RFC3339 format with Z); f-strings
+        # skip strftime's format-string parsing on every call
+        s, e = start_date, end_date
+        start_str = (f"{s.year:04d}-{s.month:02d}-{s.day:02d}"
+                     f"T{s.hour:02d}:{s.minute:02d}:{s.second:02d}Z")
+        end_str = (f"{e.year:04d}-{e.month:02d}-{e.day:02d}"
+                   f"T{e.hour:02d}:{e.minute:02d}:{e.second:02d}Z")
+
+        # Fetch only the requested fields; 'time' always comes back
+        if columns:
+            select_clause = ', '.join(f'"{c}"' for c in columns if c != 'time')
+        else:
+            select_clause = '*'
+
+        return start_str, end_str, select_clause
     
     def get_latest_date(self) -> Optional[datetime]:
         """Get the most recent date with data in the database."""
@@ -161,9 +386,11 @@ class HealthDatabase:
         
         try:
             result = self.client.query(query)
-            points = list(result.get_points())
-            if points:
-                return datetime.fromisoformat(points[0]['time'].replace('Z', '+00:00'))
+            # Single-point query: pull from the cursor directly instead of
+            # materializing a list
+            point = next(result.get_points(), None)
+            if point:
+                return datetime.fromisoformat(point['time'].replace('Z', '+00:00'))
             return None
         except Exception as e:
             print(f"Error getting latest date: {e}")
@@ -179,30 +406,16 @@ class HealthDatabase:
         if not self.client:
             raise RuntimeError("Database not connected. Call connect() first.")
         
-        date = food_data.get('date')
-        if isinstance(date, str):
-            date = datetime.fromisoformat(date)
-        
-        point = {
-            "measurement": "food_entries",
-            "time": date.isoformat(),
-            "tags": {
-                "food_name": food_data.get('food_name', 'Unknown')
-            },
-            "fields": {
-                "quantity": str(food_data.get('quantity', '')),
-                "calories": float(food_data.get('calories', 0)),
-                "protein_g": float(food_data.get('protein_g', 0)),
-                "carbs_g": float(food_data.get('carbs_g', 0)),
-                "fat_g": float(food_data.get('fat_g', 0)),
-                "sodium_mg": float(food_data.get('sodium_mg', 0)),
-                "sugar_g": float(food_data.get('sugar_g', 0)),
-                "fiber_g": float(food_data.get('fiber_g', 0)),
-            }
-        }
-        
+        # Reuse the line-protocol formatter so even single-point writes
+        # skip the client's JSON serialization
+        entry = dict(food_data)
+        entry.update(_nutrition_fields(food_data))
+
         try:
-            self.client.write_points([point])
+            self.client.write_points(
+                list(self._food_entry_lines([entry])),
+                protocol='line', time_precision='s'
+            )
             return True
         except Exception as e:
             print(f"Error writing food entry to InfluxDB: {e}")
@@ -211,46 +424,66 @@ class HealthDatabase:
     def batch_write_food_entries(self, entries: List[Dict]) -> bool:
         """
         Write multiple food entries in batch.
-        
+
         Args:
-            entries: List of food entry dicts
+            entries: List of food entry dicts; nutrition values must
+                already be numeric, as produced by LoseItCSVParser
         """
         if not self.client:
             raise RuntimeError("Database not connected. Call connect() first.")
-        
-        points = []
+
+        written, success = self._write_line_chunks(self._food_entry_lines(entries))
+
+        if success:
+            print(f"✓ Wrote {written} food entries to database")
+        return success
+
+    def _food_entry_lines(self, entries):
+        """Lazily format food entries as line protocol strings."""
         for entry in entries:
             date = entry.get('date')
-            if isinstance(date, str):
-                date = datetime.fromisoformat(date)
-            
-            point = {
-                "measurement": "food_entries",
-                "time": date.isoformat(),
-                "tags": {
-                    "food_name": entry.get('food_name', 'Unknown')
-                },
-                "fields": {
-                    "quantity": str(entry.get('quantity', '')),
-                    "calories": float(entry.get('calories', 0)),
-                    "protein_g": float(entry.get('protein_g', 0)),
-                    "carbs_g": float(entry.get('carbs_g', 0)),
-                    "fat_g": float(entry.get('fat_g', 0)),
-                    "sodium_mg": float(entry.get('sodium_mg', 0)),
-                    "sugar_g": float(entry.get('sugar_g', 0)),
-                    "fiber_g": float(entry.get('fiber_g', 0)),
-                }
-            }
-            points.append(point)
-        
-        try:
-            self.client.write_points(points)
-            print(f"✓ Wrote {len(points)} food entries to database")
-            return True
-        except Exception as e:
-            print(f"✗ Error batch writing food entries to InfluxDB: {e}")
-            return False
+            ts = _to_epoch(date)
+
+            food_name = self._escape_tag(str(entry.get('food_name', 'Unknown')))
+            quantity = self._escape_string_field(str(entry.get('quantity', '')))
+
+            # Values arrive pre-typed from the parser, so no float() per field
+            fields = f'quantity="{quantity}",' + ','.join(
+                f"{k}={entry.get(k, 0.0)}" for k in NUTRITION_FIELD_KEYS
+            )
+
+            yield f"food_entries,food_name={food_name} {fields} {ts}"
     
+    def batch_write_all(self, nutrition_entries: List[Dict],
+                        food_entries: Optional[List[Dict]] = None) -> bool:
+        """
+        Write daily nutrition and food entries in one submission.
+
+        Mixed measurements share the same line-protocol batches, so a sync
+        issues half the write requests compared to calling
+        batch_write_nutrition and batch_write_food_entries separately.
+
+        Args:
+            nutrition_entries: Daily nutrition dicts (see batch_write_nutrition)
+            food_entries: Optional individual food entry dicts
+        """
+        if not self.client:
+            raise RuntimeError("Database not connected. Call connect() first.")
+
+        food_entries = food_entries or []
+        lines = chain(
+            self._nutrition_lines(nutrition_entries),
+            self._food_entry_lines(food_entries)
+        )
+        written, success = self._write_line_chunks(lines)
+
+        if written:
+            self._query_cache.clear()
+        if success:
+            print(f"✓ Wrote {written} points to database "
+                  f"({len(nutrition_entries)} days, {len(food_entries)} food entries)")
+        return success
+
     def query_top_foods(self, limit: int = 20, days: int = 30) -> List[Dict]:
         """
         Query most frequently eaten foods.
@@ -264,7 +497,49 @@ class HealthDatabase:
         """
         if not self.client:
             raise RuntimeError("Database not connected. Call connect() first.")
-        
+
+        # InfluxQL cannot bind duration literals, so coerce to int before
+        # interpolating the look-back window
+        days = int(days)
+
+        # Query the pre-aggregated daily rollup: O(days x foods) instead of
+        # scanning every raw food_entries point in the window
+        query = f"""
+        SELECT SUM(count) as count,
+               SUM(sum_calories) as sum_calories,
+               SUM(sum_sodium) as sum_sodium
+        FROM food_daily_agg
+        WHERE time > now() - {days}d
+        GROUP BY food_name
+        """
+
+        try:
+            result = self.client.query(query)
+            foods = []
+            for key, points in result.items():
+                tags = key[1] if key[1] else {}
+                food_name = tags.get('food_name', 'Unknown')
+                for point in points:
+                    count = int(point.get('count') or 0)
+                    if not count:
+                        continue
+                    foods.append({
+                        'food_name': food_name,
+                        'count': count,
+                        'avg_calories': round((point.get('sum_calories') or 0) / count, 1),
+                        'avg_sodium': round((point.get('sum_sodium') or 0) / count, 1)
+                    })
+            if not foods:
+                # Rollup empty (e.g. data predates the continuous query)
+                return self._query_top_foods_direct(limit, days)
+            foods.sort(key=lambda x: x['count'], reverse=True)
+            return foods[:limit]
+        except Exception as e:
+            print(f"Error querying top foods rollup: {e}")
+            return self._query_top_foods_direct(limit, days)
+
+    def _query_top_foods_direct(self, limit: int, days: int) -> List[Dict]:
+        """Aggregate top foods by scanning raw food_entries directly."""
         query = f"""
         SELECT COUNT(calories) as count,
                MEAN(calories) as avg_calories,
@@ -297,3 +572,22 @@ class HealthDatabase:
         """Close database connection."""
         if self.client:
             self.client.close()
+
+
+_instance = None
+
+
+def get_db() -> HealthDatabase:
+    """Get the shared HealthDatabase for this process.
+
+    Reusing one instance keeps a single pooled HTTP session alive across
+    sync and chat code paths instead of re-handshaking per caller.
+    Callers still run connect() themselves (it is idempotent); the
+    connection is closed automatically at interpreter exit, so callers
+    must not close it.
+    """
+    global _instance
+    if _instance is None:
+        _instance = HealthDatabase()
+        atexit.register(_instance.close)
+    return _instance
@@ -2,8 +2,11 @@
 import os
 import base64
 import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -27,7 +30,11 @@ class GmailFetcher:
         self.credentials_file = os.getenv('GMAIL_CREDENTIALS_FILE', 'credentials.json')
         self.token_file = os.getenv('GMAIL_TOKEN_FILE', 'token.json')
         self.service = None
-        
+        self._creds = None
+        self._thread_local = threading.local()
+        self._label_id = None
+        self.label_cache_file = os.getenv('GMAIL_LABEL_CACHE_FILE', '.label_cache.json')
+
     def authenticate(self, headless: bool = None):
         """Authenticate with Gmail API using OAuth2.
         
@@ -99,50 +106,91 @@ class GmailFetcher:
             with open(self.token_file, 'w') as token:
                 token.write(creds.to_json())
         
+        self._creds = creds
         self.service = build('gmail', 'v1', credentials=creds)
         print(f"✓ Authenticated with Gmail API")
         return True
+
+    def _service_for_thread(self):
+        """Get a Gmail service for the current thread.
+
+        googleapiclient service objects share an httplib2.Http instance
+        that is not thread-safe, so worker threads each build their own.
+        """
+        if threading.current_thread() is threading.main_thread():
+            return self.service
+        service = getattr(self._thread_local, 'service', None)
+        if service is None:
+            service = build('gmail', 'v1', credentials=self._creds)
+            self._thread_local.service = service
+        return service
     
     def get_label_id(self) -> Optional[str]:
-        """Get the Gmail label ID for the specified label name."""
+        """Get the Gmail label ID for the specified label name.
+
+        Labels are stable, so the ID is cached in memory and persisted to
+        a sidecar file; the full label listing only runs on a cold cache.
+        """
         if not self.service:
             raise RuntimeError("Not authenticated. Call authenticate() first.")
-        
+
+        if self._label_id:
+            return self._label_id
+
+        # Try the on-disk cache from a previous run
+        try:
+            with open(self.label_cache_file) as f:
+                cached = json.load(f)
+            if cached.get('label_name') == self.label_name and cached.get('label_id'):
+                self._label_id = cached['label_id']
+                return self._label_id
+        except (OSError, ValueError):
+            pass
+
         try:
             results = self.service.users().labels().list(userId='me').execute()
             labels = results.get('labels', [])
-            
+
             for label in labels:
                 if label['name'] == self.label_name:
-                    return label['id']
-            
+                    self._label_id = label['id']
+                    try:
+                        with open(self.label_cache_file, 'w') as f:
+                            json.dump({'label_name': self.label_name,
+                                       'label_id': self._label_id}, f)
+                    except OSError:
+                        pass
+                    return self._label_id
+
             print(f"✗ Label '{self.label_name}' not found in Gmail")
             return None
         except Exception as e:
             print(f"✗ Error getting label ID: {e}")
             return None
     
-    def fetch_messages(self, days_back: int = 90) -> List[Dict]:
+    def fetch_messages(self, days_back: int = 90) -> Iterator[Dict]:
         """
         Fetch messages with the specified label.
-        
+
         Args:
             days_back: Number of days to look back for messages
-            
+
         Returns:
-            List of message data with attachments
+            Iterator of message data with attachments; messages are
+            yielded as their attachment batches complete, so callers can
+            process early messages while later ones are still downloading
         """
         if not self.service:
             raise RuntimeError("Not authenticated. Call authenticate() first.")
-        
+
         label_id = self.get_label_id()
         if not label_id:
-            return []
-        
+            return iter(())
+
         # Calculate date filter
         after_date = datetime.now() - timedelta(days=days_back)
         query = f"after:{after_date.strftime('%Y/%m/%d')}"
-        
+
         try:
             # Get message list
             results = self.service.users().messages().list(
@@ -150,26 +198,149 @@ class GmailFetcher:
                 labelIds=[label_id],
                 q=query
             ).execute()
-            
+
             messages = results.get('messages', [])
             print(f"✓ Found {len(messages)} messages with label '{self.label_name}'")
-            
-            message_data = []
-            for msg in messages:
-                msg_detail = self._get_message_with_attachments(msg['id'])
-                if msg_detail:
-                    message_data.append(msg_detail)
-            
-            return message_data
-            
         except Exception as e:
             print(f"✗ Error fetching messages: {e}")
-            return []
+            return iter(())
+
+        return self._generate_messages(messages)
+
+    def _generate_messages(self, messages) -> Iterator[Dict]:
+        """Yield message details, batched first, threaded as fallback."""
+        # Bundle the per-message requests into batch HTTP calls; fall
+        # back to threaded individual fetches if batching fails
+        yielded = set()
+        try:
+            for detail in self._fetch_messages_batch(messages):
+                yielded.add(detail['id'])
+                yield detail
+            return
+        except Exception as e:
+            print(f"✗ Batch fetch failed ({e}), fetching messages individually")
+
+        # Each fetch is a blocking HTTPS round-trip, so overlap them;
+        # anything the batch path already delivered is skipped
+        remaining = [m for m in messages if m['id'] not in yielded]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for detail in executor.map(
+                lambda m: self._get_message_with_attachments(m['id']),
+                remaining
+            ):
+                if detail:
+                    yield detail
+
+    def _execute_batched(self, calls, callback):
+        """Execute (request_id, request) pairs in batches of up to 100.
+
+        The Gmail batch endpoint accepts at most 100 sub-requests per
+        multipart POST, so larger call lists are split.
+        """
+        for i in range(0, len(calls), 100):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for request_id, request in calls[i:i + 100]:
+                batch.add(request, request_id=request_id)
+            batch.execute()
+
+    def _fetch_messages_batch(self, messages) -> Iterator[Dict]:
+        """Fetch message details and CSV attachments via batch HTTP.
+
+        One batched round-trip retrieves every message body, then the
+        attachments download 100 per round-trip; each message is yielded
+        as soon as its last attachment arrives, so parsing can overlap
+        with the batches still in flight.
+        """
+        if not messages:
+            return
+
+        users = self.service.users()
+
+        details = {}
+
+        def on_message(request_id, response, exception):
+            if exception is not None:
+                print(f"✗ Error getting message {request_id}: {exception}")
+            else:
+                details[request_id] = response
+
+        self._execute_batched(
+            [(msg['id'], users.messages().get(userId='me', id=msg['id'], format='full'))
+             for msg in messages],
+            on_message
+        )
+
+        # Collect CSV attachment references per message
+        pending = []
+        attachment_calls = []
+        for msg in messages:
+            message = details.get(msg['id'])
+            if not message:
+                continue
+
+            headers = message['payload'].get('headers', [])
+            date_str = None
+            for header in headers:
+                if header['name'].lower() == 'date':
+                    date_str = header['value']
+                    break
+
+            parts = []
+            for part in message['payload'].get('parts', []):
+                if part.get('filename') and part['filename'].endswith('.csv'):
+                    idx = len(attachment_calls)
+                    key = f"{msg['id']}:{idx}"
+                    attachment_calls.append((
+                        key,
+                        users.messages().attachments().get(
+                            userId='me',
+                            messageId=msg['id'],
+                            id=part['body']['attachmentId']
+                        )
+                    ))
+                    parts.append({'filename': part['filename'], 'key': key, 'idx': idx})
+
+            if parts:
+                pending.append({'id': msg['id'], 'date': date_str, 'parts': parts})
+
+        attachment_data = {}
+
+        def on_attachment(request_id, response, exception):
+            if exception is not None:
+                print(f"✗ Error downloading attachment: {exception}")
+            else:
+                attachment_data[request_id] = self._decode_attachment(response['data'])
+
+        # Execute the attachment batches one at a time; after each one,
+        # every message whose attachments have all been requested is ready
+        next_msg = 0
+        for i in range(0, len(attachment_calls), 100):
+            batch = self.service.new_batch_http_request(callback=on_attachment)
+            for request_id, request in attachment_calls[i:i + 100]:
+                batch.add(request, request_id=request_id)
+            batch.execute()
+
+            fetched = min(i + 100, len(attachment_calls))
+            while next_msg < len(pending):
+                msg = pending[next_msg]
+                if msg['parts'][-1]['idx'] >= fetched:
+                    break
+                attachments = [
+                    {'filename': part['filename'], 'data': attachment_data[part['key']]}
+                    for part in msg['parts'] if part['key'] in attachment_data
+                ]
+                if attachments:
+                    yield {
+                        'id': msg['id'],
+                        'date': msg['date'],
+                        'attachments': attachments
+                    }
+                next_msg += 1
     
     def _get_message_with_attachments(self, msg_id: str) -> Optional[Dict]:
         """Get message details including CSV attachments."""
         try:
-            message = self.service.users().messages().get(
+            message = self._service_for_thread().users().messages().get(
                 userId='me',
                 id=msg_id,
                 format='full'
@@ -212,16 +383,25 @@ class GmailFetcher:
     def _get_attachment(self, msg_id: str, attachment_id: str) -> Optional[bytes]:
         """Download attachment data."""
         try:
-            attachment = self.service.users().messages().attachments().get(
+            attachment = self._service_for_thread().users().messages().attachments().get(
                 userId='me',
                 messageId=msg_id,
                 id=attachment_id
             ).execute()
             
-            data = attachment['data']
-            file_data = base64.urlsafe_b64decode(data)
-            return file_data
-            
+            return self._decode_attachment(attachment['data'])
+
         except Exception as e:
             print(f"✗ Error downloading attachment: {e}")
             return None
+
+    @staticmethod
+    def _decode_attachment(data) -> bytes:
+        """Base64-decode attachment payload from the Gmail API.
+
+        Encoding the str to ASCII first lets b64decode work on bytes
+        directly instead of re-validating and copying the str itself.
+        """
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        return base64.urlsafe_b64decode(data)
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """Main script to sync Lose It! data from Gmail to InfluxDB."""
 import os
+import queue
 import sys
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # Add src to path
@@ -10,7 +12,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from gmail_fetcher import GmailFetcher
 from csv_parser import LoseItCSVParser
-from database import HealthDatabase
+from database import get_db
 
 load_dotenv()
 
@@ -28,7 +30,7 @@ def main():
     # Initialize components
     gmail = GmailFetcher()
     parser = LoseItCSVParser()
-    db = HealthDatabase()
+    db = get_db()
     
     try:
         # Step 1: Connect to database
@@ -37,8 +39,15 @@ def main():
             print("✗ Failed to connect to database. Is InfluxDB running?")
             print("  Try: docker compose up -d")
             return 1
+
+        # Shrink the window to the days actually missing from the database
+        latest = db.get_latest_date()
+        if latest:
+            days_missing = (datetime.now(timezone.utc) - latest).days + 1
+            lookback_days = max(7, min(lookback_days, days_missing))
+            print(f"  Last synced day: {latest.date().isoformat()}")
         print()
-        
+
         # Step 2: Authenticate with Gmail
         print("[2/4] Authenticating with Gmail...")
         try:
@@ -53,42 +62,64 @@ def main():
             return 1
         print()
         
-        # Step 3: Fetch emails and attachments
+        # Step 3: Fetch emails and attachments in a background thread,
+        # feeding each CSV through a bounded queue as it arrives
         print(f"[3/4] Fetching emails from last {lookback_days} days...")
-        messages = gmail.fetch_messages(days_back=lookback_days)
-        
-        if not messages:
+
+        attachment_q = queue.Queue(maxsize=4)
+
+        def fetch_worker():
+            try:
+                for msg in gmail.fetch_messages(days_back=lookback_days):
+                    for attachment in msg['attachments']:
+                        attachment_q.put(attachment)
+            finally:
+                attachment_q.put(None)  # sentinel: fetching done
+
+        fetcher = threading.Thread(target=fetch_worker, daemon=True)
+        fetcher.start()
+
+        filenames = []
+
+        def iter_attachments():
+            while True:
+                attachment = attachment_q.get()
+                if attachment is None:
+                    break
+                filenames.append(attachment['filename'])
+                yield attachment['data']
+
+        # Step 4: Parse while attachments download, then store
+        print("[4/4] Parsing CSV data and storing in database...")
+        nutrition_data, food_entries = parser.parse_multiple_csvs(
+            iter_attachments(), extract_foods=True
+        )
+        fetcher.join()
+
+        if not filenames:
             print("✗ No messages found with CSV attachments")
             return 1
-        
-        print(f"✓ Found {len(messages)} emails with attachments")
-        
-        # Extract all CSV files
-        csv_files = []
-        for msg in messages:
-            for attachment in msg['attachments']:
-                print(f"  - {attachment['filename']}")
-                csv_files.append(attachment['data'])
-        
+
+        print("  Attachments: " + ", ".join(filenames))
         print()
-        
-        # Step 4: Parse and store data
-        print("[4/4] Parsing CSV data and storing in database...")
-        nutrition_data, food_entries = parser.parse_multiple_csvs(csv_files, extract_foods=True)
-        
+
         if not nutrition_data:
             print("✗ No data parsed from CSV files")
             return 1
-        
-        # Write daily nutrition data to database
-        success = db.batch_write_nutrition(nutrition_data)
-        
-        # Write individual food entries to database
-        if food_entries:
-            food_success = db.batch_write_food_entries(food_entries)
-            if not food_success:
-                print("⚠ Warning: Failed to write some food entries")
-        
+
+        # Drop days already in the database so the write is O(delta);
+        # ISO date strings compare correctly as plain strings
+        if latest:
+            cutoff = latest.date().isoformat()
+            nutrition_data = [e for e in nutrition_data if e['date'] > cutoff]
+            food_entries = [e for e in food_entries if e['date'] > cutoff]
+            if not nutrition_data and not food_entries:
+                print("✓ Database already up to date, nothing new to write")
+                return 0
+
+        # Write nutrition and food entries in one combined submission
+        success = db.batch_write_all(nutrition_data, food_entries)
+
         if success:
             print()
             print("=" * 60)
@@ -121,8 +152,7 @@ def main():
         import traceback
         traceback.print_exc()
         return 1
-    finally:
-        db.close()
+    # The shared database connection is closed by get_db's atexit hook
 
 
 if __name__ == '__main__':